@@ -7,80 +7,163 @@
 """
 
 import os
+import copy
 import sys
 import argparse
-import glob
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import re
+from xml.sax.saxutils import escape as xml_escape
 
 try:
+    import docx
     from docx import Document
     from docx.shared import Pt, Inches, Cm
     from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_PARAGRAPH_ALIGNMENT
     from docx.enum.section import WD_SECTION
-    from docx.oxml.ns import qn
+    from docx.oxml.ns import qn, nsdecls
     from docx.oxml import parse_xml
-    from docx.oxml.shared import OxmlElement
+    from docx.text.run import Run
+    from lxml.etree import SubElement
 except ImportError as e:
     print("错误：缺少必要的依赖包，请先安装 python-docx")
-    print("安装命令：pip install python-docx")
+    print('安装命令：pip install "python-docx>=1.0.0"')
     sys.exit(1)
 
+# 读取段落文本用到的 CT_P.text 需要 python-docx 1.0 及以上版本
+if int(docx.__version__.split('.')[0]) < 1:
+    print(f"错误：python-docx 版本过低（当前 {docx.__version__}），需要 1.0.0 及以上")
+    print('升级命令：pip install -U "python-docx>=1.0.0"')
+    sys.exit(1)
+
+_QN_P = qn('w:p')
+_QN_SECTPR = qn('w:sectPr')
+_QN_T = qn('w:t')
+_QN_R = qn('w:r')
+_QN_FLDSIMPLE = qn('w:fldSimple')
+_QN_INSTR = qn('w:instr')
+
+# 三级标题前缀：1. ~ 19. 或 （1）~（10）
+_LEVEL3_RE = re.compile(r'(?:1[0-9]|[1-9])\.|（(?:10|[1-9])）')
+
+# 空白文档模板，只从磁盘加载一次
+_TEMPLATE_DOC = Document()
+
+# 与 add_run 一致：制表符转为 w:tab，换行（\n、\r）转为 w:br
+_RUN_TEXT_BREAKS = str.maketrans({
+    '\t': '</w:t><w:tab/><w:t xml:space="preserve">',
+    '\n': '</w:t><w:br/><w:t xml:space="preserve">',
+    '\r': '</w:t><w:br/><w:t xml:space="preserve">',
+})
+
+def _run_text_xml(text):
+    """将文本转义为可填入段落模板 {text} 处的 w:t 内容"""
+    return xml_escape(text).translate(_RUN_TEXT_BREAKS)
+
+def _build_paragraph_template(settings, cjk_font_names, alignment, space_after=None,
+                              line_spacing=None, first_line_indent=None):
+    """生成段落 XML 模板（正文位置为 {text} 占位符，需填入 _run_text_xml 处理后的文本）"""
+    name = settings['name']
+    
+    # 段落格式
+    spacing = ''
+    if space_after is not None:
+        spacing += f' w:after="{space_after.twips}"'
+    if line_spacing is not None:
+        spacing += f' w:line="{line_spacing.twips}" w:lineRule="exact"'
+    ppr = f'<w:spacing{spacing}/>' if spacing else ''
+    if first_line_indent is not None:
+        ppr += f'<w:ind w:firstLine="{first_line_indent.twips}"/>'
+    ppr += f'<w:jc w:val="{alignment}"/>'
+    
+    # 字体格式
+    east_asia = f' w:eastAsia="{name}"' if name in cjk_font_names else ''
+    bold = '<w:b/>' if settings.get('bold', False) else '<w:b w:val="0"/>'
+    size = int(settings['size'].pt * 2)
+    rpr = (f'<w:rFonts w:ascii="{name}" w:hAnsi="{name}"{east_asia}/>'
+           f'{bold}<w:sz w:val="{size}"/>')
+    
+    return (f'<w:p><w:pPr>{ppr}</w:pPr><w:r><w:rPr>{rpr}</w:rPr>'
+            '<w:t xml:space="preserve">{text}</w:t></w:r></w:p>')
+
 class OfficialDocumentFormatter:
     """公文格式化类"""
     
-    def __init__(self):
-        self.format_settings = {
-            'page': {
-                'height': Cm(29.7),        # A4高度29.7cm
-                'width': Cm(21),           # A4宽度21cm
-                'top_margin': Cm(3.7),     # 上边距3.7cm
-                'bottom_margin': Cm(3.2),  # 下边距3.2cm
-                'left_margin': Cm(2.8),    # 左边距2.8cm
-                'right_margin': Cm(2.6),   # 右边距2.6cm
-            },
-            'fonts': {
-                'title': {'size': Pt(22), 'name': '方正小标宋简体'},                      # 二号
-                'level1': {'size': Pt(16), 'name': '黑体', 'bold': True},                 # 三号黑体
-                'level2': {'size': Pt(16), 'name': '楷体_GB2312', 'bold': True},          # 三号楷体加粗
-                'level3': {'size': Pt(16), 'name': '仿宋_GB2312', 'bold': True},          # 三号仿宋加粗
-                'body': {'size': Pt(16), 'name': '仿宋_GB2312', 'bold': False},           # 三号仿宋
-                'footer': {'size': Pt(14), 'name': 'Times New Roman', 'bold': False},     # 四号
-            },
-            'spacing': {
-                'line_spacing': Pt(28),        # 行间距28磅
-                'title_spacing': Pt(0),       # 标题段间距30磅
-                'body_spacing': Pt(0),         # 正文段间距
-                'first_line_indent': Cm(1.7),  # 首行缩进2个字符（约0.85cm）
-            }
+    # 一、二级标题前缀 -> 标题级别（三级标题由 _LEVEL3_RE 匹配）
+    _PREFIX_MAP = {
+        **{f"{n}、": 'level1' for n in '一二三四五六七八九十'},          # 一级标题：一、
+        **{f"（{n}）": 'level2' for n in '一二三四五六七八九十'},        # 二级标题：（一）
+    }
+    # 标题可能的首字符，不在其中的段落直接判定为正文
+    _PREFIX_LEAD_CHARS = frozenset(k[0] for k in _PREFIX_MAP) | frozenset('123456789')
+    
+    format_settings = {
+        'page': {
+            'height': Cm(29.7),        # A4高度29.7cm
+            'width': Cm(21),           # A4宽度21cm
+            'top_margin': Cm(3.7),     # 上边距3.7cm
+            'bottom_margin': Cm(3.2),  # 下边距3.2cm
+            'left_margin': Cm(2.8),    # 左边距2.8cm
+            'right_margin': Cm(2.6),   # 右边距2.6cm
+        },
+        'fonts': {
+            'title': {'size': Pt(22), 'name': '方正小标宋简体'},                      # 二号
+            'level1': {'size': Pt(16), 'name': '黑体', 'bold': True},                 # 三号黑体
+            'level2': {'size': Pt(16), 'name': '楷体_GB2312', 'bold': True},          # 三号楷体加粗
+            'level3': {'size': Pt(16), 'name': '仿宋_GB2312', 'bold': True},          # 三号仿宋加粗
+            'body': {'size': Pt(16), 'name': '仿宋_GB2312', 'bold': False},           # 三号仿宋
+            'footer': {'size': Pt(14), 'name': 'Times New Roman', 'bold': False},     # 四号
+        },
+        'spacing': {
+            'line_spacing': Pt(28),        # 行间距28磅
+            'title_spacing': Pt(0),       # 标题段间距30磅
+            'body_spacing': Pt(0),         # 正文段间距
+            'first_line_indent': Cm(1.7),  # 首行缩进2个字符（约0.85cm）
         }
+    }
+    _fonts = format_settings['fonts']
+    # 需要单独设置东亚字体（w:eastAsia）的中文字体
+    _cjk_font_names = frozenset({'方正小标宋简体', '黑体', '楷体_GB2312', '仿宋_GB2312'})
+    
+    # 首行缩进2字符（三号字32磅），预先算好的 Length（EMU 整数）
+    _first_indent_emu = Pt(32)
+    
+    # 各级段落的 XML 模板（类定义时生成一次）
+    _PARA_TEMPLATES = {
+        'title': _build_paragraph_template(
+            _fonts['title'], _cjk_font_names, 'center',
+            space_after=format_settings['spacing']['title_spacing']),
+        # 标题段落也缩进
+        'level1': _build_paragraph_template(
+            _fonts['level1'], _cjk_font_names, 'left',
+            line_spacing=format_settings['spacing']['line_spacing'], first_line_indent=_first_indent_emu),
+        'level2': _build_paragraph_template(
+            _fonts['level2'], _cjk_font_names, 'left',
+            line_spacing=format_settings['spacing']['line_spacing'], first_line_indent=_first_indent_emu),
+        'level3': _build_paragraph_template(
+            _fonts['level3'], _cjk_font_names, 'left',
+            line_spacing=format_settings['spacing']['line_spacing'], first_line_indent=_first_indent_emu),
+        'body': _build_paragraph_template(
+            _fonts['body'], _cjk_font_names, 'both',
+            line_spacing=format_settings['spacing']['line_spacing'], first_line_indent=_first_indent_emu),
+        # 落款：正文字体，右对齐
+        'signature': _build_paragraph_template(_fonts['body'], _cjk_font_names, 'right'),
+    }
     
     def detect_title_level(self, text):
         """检测标题级别"""
-        text = text.strip()
-        if text.startswith(('一、', '二、', '三、', '四、', '五、', '六、', '七、', '八、', '九、', '十、')):
-            return 'level1'
-        elif text.startswith(('（一）', '（二）', '（三）', '（四）', '（五）', '（六）', '（七）', '（八）', '（九）', '（十）')):
-            return 'level2'
-        elif text.startswith(tuple(f"{i}." for i in range(1, 20))):
-            return 'level3'
-        elif text.startswith(('（1）', '（2）', '（3）', '（4）', '（5）', '（6）', '（7）', '（8）', '（9）', '（10）')):
-            return 'level3'
-        else:
+        t = text.lstrip()[:4]
+        # 快速排除：大多数正文段落首字符不可能构成标题前缀
+        if not t or t[0] not in self._PREFIX_LEAD_CHARS:
             return 'body'
-    
-    def apply_font_formatting(self, run, font_type):
-        """应用字体格式"""
-        settings = self.format_settings['fonts'][font_type]
-        run.font.size = settings['size']
-        run.font.bold = settings.get('bold', False)
-        
-        # 设置字体
-        run.font.name = settings['name']
-        if '方正' in settings['name'] or '黑体' in settings['name'] or '楷体_GB2312' in settings['name'] or '仿宋_GB2312' in settings['name']:
-            r = run._element
-            r.rPr.rFonts.set(qn('w:eastAsia'), settings['name'])
+        prefix_map = self._PREFIX_MAP
+        level = prefix_map.get(t[:2]) or prefix_map.get(t[:3])
+        if level:
+            return level
+        if _LEVEL3_RE.match(t):
+            return 'level3'
+        return 'body'
     
     def setup_page_layout(self, section):
         """设置页面布局"""
@@ -94,24 +177,26 @@ class OfficialDocumentFormatter:
     
     def create_page_number_element(self, paragraph):
         """创建页码元素"""
-        # 创建页码字段
-        fldChar1 = OxmlElement('w:fldChar')
-        fldChar1.set(qn('w:fldCharType'), 'begin')
+        # 使用简单域 <w:fldSimple w:instr="PAGE">，域结果为其中的一个 run；
+        # 直接用 SubElement 建树，属性在创建时一并设置
+        fld_simple = SubElement(paragraph._p, _QN_FLDSIMPLE, {_QN_INSTR: 'PAGE'})
+        r = SubElement(fld_simple, _QN_R)
+        SubElement(r, _QN_T).text = "1"
         
-        instrText = OxmlElement('w:instrText')
-        instrText.text = "PAGE"
-        instrText.set(qn('w:space'), 'preserve')
-        
-        fldChar2 = OxmlElement('w:fldChar')
-        fldChar2.set(qn('w:fldCharType'), 'end')
-        
-        # 添加分隔符
-        run = paragraph.add_run()
-        run._element.append(fldChar1)
-        run._element.append(instrText)
-        run._element.append(fldChar2)
+        # 返回域内的 run，调用方对其设置的字体即为页码字体
+        return Run(r, paragraph)
+    
+    def _reset_footer_paragraph(self, footer):
+        """清空页脚，仅保留第一个段落（清空其内容与格式）并返回；页脚无段落时新建"""
+        ftr = footer._element
+        paras = ftr.findall(_QN_P)
+        if not paras:
+            return footer.add_paragraph()
         
-        return run
+        for p in paras[1:]:
+            ftr.remove(p)
+        paras[0].clear()
+        return footer.paragraphs[0]
     
     def add_page_numbers(self, doc):
         """添加页码到文档的页脚"""
@@ -119,14 +204,8 @@ class OfficialDocumentFormatter:
             for i, section in enumerate(doc.sections):
                 footer = section.footer
                 
-                # 清除现有的页脚内容
-                if footer.paragraphs:
-                    for para in footer.paragraphs:
-                        p = para._element
-                        p.getparent().remove(p)
-                
-                # 创建页脚段落
-                footer_para = footer.add_paragraph()
+                # 清除现有的页脚内容，复用（或创建）页脚段落
+                footer_para = self._reset_footer_paragraph(footer)
                 footer_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
                 
                 # 添加左括号
@@ -155,12 +234,7 @@ class OfficialDocumentFormatter:
         """手动添加页码（备选方案）"""
         for i, section in enumerate(doc.sections):
             footer = section.footer
-            if footer.paragraphs:
-                for para in footer.paragraphs:
-                    p = para._element
-                    p.getparent().remove(p)
-            
-            footer_para = footer.add_paragraph()
+            footer_para = self._reset_footer_paragraph(footer)
             footer_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
         
             # 添加页码格式 (-1-)
@@ -170,6 +244,15 @@ class OfficialDocumentFormatter:
             footer_run.font.name = self.format_settings['fonts']['footer']['name']
             print(f"使用备选方案添加页码: - {page_number} -")
     
+    def _append_to_body(self, body, elements):
+        """将段落元素依次追加到 body 末尾（w:sectPr 必须是 body 的最后一个子元素）"""
+        sect_pr = body.find(_QN_SECTPR)
+        for el in elements:
+            if sect_pr is not None:
+                sect_pr.addprevious(el)
+            else:
+                body.append(el)
+    
     def process_document_structure(self, doc, new_doc):
         """处理文档结构"""
         title_processed = False
@@ -178,26 +261,22 @@ class OfficialDocumentFormatter:
 
 
         
-        # 收集所有有内容的段落
-        for para in doc.paragraphs:
-            if para.text.strip():
-                content_paragraphs.append(para)
-
-         # 遍历所有段落，设置段后间距为0
-        for paragraph in doc.paragraphs:
-            paragraph_format = paragraph.paragraph_format
-            paragraph_format.space_after = Pt(0)
+        # 直接遍历底层 XML 收集所有有内容的段落文本，
+        # 不为空段落（以及后续只需要文本的段落）构造 Paragraph 对象；
+        # CT_P.text 与 Paragraph.text 一致（保留制表符、换行和超链接文本，不含图形/文本框内容）
+        for p in doc.element.body.iterchildren(_QN_P):
+            text = p.text.strip()
+            if text:
+                content_paragraphs.append(text)
         
+        # 逐段渲染为 XML 字符串，最后一次性 parse_xml，
+        # 代替逐段 add_paragraph/add_run/设置字体 的对象操作
+        templates = self._PARA_TEMPLATES
+        fragments = []
         if content_paragraphs:
             # 第一个段落作为标题
-            title_text = content_paragraphs[0].text.strip()
-            title_para = new_doc.add_paragraph()
-            title_run = title_para.add_run(title_text)
-            
-            # 设置标题格式
-            title_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-            self.apply_font_formatting(title_run, 'title')
-            title_para.paragraph_format.space_after = self.format_settings['spacing']['title_spacing']
+            title_text = content_paragraphs[0]
+            fragments.append(templates['title'].format(text=_run_text_xml(title_text)))
             title_processed = True
         
         # 添加空行（正文前空一行）
@@ -206,29 +285,15 @@ class OfficialDocumentFormatter:
         # new_para1.paragraph_format.space_after = self.format_settings['spacing']['line_spacing']
         
         # 处理正文内容（跳过标题段落）
-        for para in content_paragraphs[1:] if title_processed else content_paragraphs:
-            if not para.text.strip():
-                continue
-                
-            new_para = new_doc.add_paragraph()
-            text_content = para.text.strip()
-            
-            # 检测标题级别并应用格式
-            level = self.detect_title_level(text_content)
-            run = new_para.add_run(text_content)
-            self.apply_font_formatting(run, level)
-            
-            # 设置段落格式
-            new_para.paragraph_format.line_spacing = self.format_settings['spacing']['line_spacing']
-            
-            # 为正文段落添加首行缩进2字符
-            if level == 'body':
-                new_para.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-                new_para.paragraph_format.first_line_indent = Pt(32)
-            else:
-                new_para.alignment = WD_ALIGN_PARAGRAPH.LEFT
-            # 标题段落也缩进
-                new_para.paragraph_format.first_line_indent = Pt(32)
+        detect = self.detect_title_level
+        append = fragments.append
+        for text_content in content_paragraphs[1:] if title_processed else content_paragraphs:
+            # 检测标题级别并套用对应模板
+            append(templates[detect(text_content)].format(text=_run_text_xml(text_content)))
+        
+        if fragments:
+            body = parse_xml(f'<w:body {nsdecls("w")}>{"".join(fragments)}</w:body>')
+            self._append_to_body(new_doc.element.body, list(body))
     
     def add_signature_block(self, doc, organization_name):
         """添加落款 - 修复版本"""
@@ -237,10 +302,9 @@ class OfficialDocumentFormatter:
         # doc.add_paragraph()
         
         # 添加单位名称
-        org_para = doc.add_paragraph()
-        org_para.alignment = WD_ALIGN_PARAGRAPH.RIGHT
-        org_run = org_para.add_run(organization_name)
-        self.apply_font_formatting(org_run, 'body')
+        sig = self._PARA_TEMPLATES['signature'].format(text=_run_text_xml(organization_name))
+        org_para = parse_xml(f'<w:body {nsdecls("w")}>{sig}</w:body>')[0]
+        self._append_to_body(doc.element.body, [org_para])
         
     
     def format_document(self, input_path, output_path, organization_name="发文单位名称年月日"):
@@ -253,8 +317,8 @@ class OfficialDocumentFormatter:
             print(f"正在读取文档: {input_path}")
             doc = Document(input_path)
             
-            # 创建新文档
-            new_doc = Document()
+            # 创建新文档（复制预先加载的空白模板，避免每次重新解压、解析默认模板）
+            new_doc = copy.deepcopy(_TEMPLATE_DOC)
             
             # 设置页面布局
             section = new_doc.sections[0]
@@ -269,13 +333,13 @@ class OfficialDocumentFormatter:
             # 添加页码
             self.add_page_numbers(new_doc)
             
+            # 验证页码是否添加成功
+            self.verify_page_numbers(new_doc)
+            
             # 保存文档
             print(f"正在保存格式化后的文档: {output_path}")
             new_doc.save(output_path)
             
-            # 验证页码是否添加成功
-            self.verify_page_numbers(output_path)
-            
             print(f"文档格式化完成！输出文件: {output_path}")
             return True
             
@@ -285,21 +349,18 @@ class OfficialDocumentFormatter:
             traceback.print_exc()
             return False
     
-    def verify_page_numbers(self, file_path):
-        """验证页码是否添加成功 - 修复版本"""
+    def verify_page_numbers(self, doc):
+        """验证页码是否添加成功（直接检查内存中的文档，无需重新读取已保存的文件）"""
         try:
-            test_doc = Document(file_path)
             has_page_numbers = False
             
-            for section in test_doc.sections:
+            for section in doc.sections:
                 footer = section.footer
-                if footer and footer.paragraphs:
-                    for para in footer.paragraphs:
-                        if para.text and '-' in para.text:
-                            has_page_numbers = True
-                            break
-                
-                if has_page_numbers:
+                # 只检查已有页脚定义的节，避免访问 _element 时新建页脚
+                if footer.is_linked_to_previous:
+                    continue
+                if '-' in ''.join(footer._element.itertext()):
+                    has_page_numbers = True
                     break
             
             if has_page_numbers:
@@ -313,10 +374,28 @@ class OfficialDocumentFormatter:
 
 def get_word_files():
     """获取当前目录下的Word文档"""
-    word_files = []
-    for pattern in ["*.docx", "*.doc"]:
-        word_files.extend(glob.glob(pattern))
-    return [f for f in word_files if not f.endswith("_格式化.docx") and not f.endswith("_格式化.doc")]
+    # 单次遍历目录，跳过已格式化的输出文件
+    skip = ("_格式化.docx", "_格式化.doc")
+    return [e.name for e in os.scandir('.')
+            if e.is_file() and e.name.endswith((".docx", ".doc")) and not e.name.endswith(skip)]
+
+def _format_one(input_path, organization_name):
+    """批量模式下的单文件处理（在子进程中执行）"""
+    output_path = Path(input_path).stem + "_格式化.docx"
+    formatter = OfficialDocumentFormatter()
+    return formatter.format_document(input_path, output_path, organization_name)
+
+def batch_format(word_files, organization_name):
+    """批量格式化：各文件相互独立，使用进程池并行处理"""
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = list(executor.map(_format_one, word_files,
+                                    [organization_name] * len(word_files)))
+    
+    failed = [f for f, ok in zip(word_files, results) if not ok]
+    print(f"批量格式化完成：成功 {len(word_files) - len(failed)} 个，失败 {len(failed)} 个")
+    for f in failed:
+        print(f"  失败: {f}")
+    return not failed
 
 def main():
     """主函数"""
@@ -324,8 +403,20 @@ def main():
     parser.add_argument('input', nargs='?', help='输入Word文档路径')
     parser.add_argument('output', nargs='?', help='输出Word文档路径')
     parser.add_argument('--organization', '-o', default='发文单位名称年月日', help='发文单位名称')
+    parser.add_argument('--batch', action='store_true', help='并行格式化当前目录下的所有Word文档')
     
     args = parser.parse_args()
+    
+    # 批量模式
+    if args.batch:
+        word_files = get_word_files()
+        if not word_files:
+            print("错误：当前目录下未找到Word文档（.docx 或 .doc）")
+            sys.exit(1)
+        if not batch_format(word_files, args.organization):
+            sys.exit(1)
+        return
+    
     formatter = OfficialDocumentFormatter()
     
     # 处理输入输出路径
@@ -371,6 +462,6 @@ if __name__ == "__main__":
     main()
 
 #<code_start project_name=公文格式化工具 filename=requirements.txt title=项目依赖文件 entrypoint=false runnable=false project_final_file=true>
-#python-docx>=0.8.11
+#python-docx>=1.0.0
 #<code_end>
 